@@ -0,0 +1,155 @@
+# benchmark.py
+
+import os
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+import sys
+import glob
+import json
+import time
+import wave
+import argparse
+import configparser
+import platform as py_platform
+import numpy as np
+from threading import Thread, Event
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+import main
+from main import SAMPLE_RATE, AudioCaptureEngine, CommandProcessor, ModelManager, NetworkNLUProcessor, NullAudioPlayer, TurnTracer
+
+BENCHMARK_PROMPTS = {
+    'en': ["open the camera", "what is the weather like today", "search for the nearest coffee shop", "play some relaxing music", "tell me a joke about computers"],
+    'hi': ["आज मौसम कैसा है", "कैमरा खोलो", "कुछ अच्छा संगीत चलाओ", "मुझे एक चुटकुला सुनाओ"],
+}
+DEFAULT_CANNED = {
+    "open": {"action": "open_app", "parameters": {"app_name": "camera", "package_name": "com.android.camera"}, "spoken_response": "Opening the camera."},
+    "search": {"action": "web_search", "parameters": {"query": "nearest coffee shop"}, "spoken_response": "Here is what I found for the nearest coffee shop."},
+    "play": {"action": "play_media", "parameters": {"query": "relaxing music"}, "spoken_response": "Playing some relaxing music for you."},
+}
+
+
+class StubNLUServer:
+    def __init__(self, latency_ms=50, canned=None, host='127.0.0.1', port=0):
+        self.latency, self.canned, self.histories, stub = latency_ms / 1000, DEFAULT_CANNED if canned is None else canned, {}, self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def do_GET(self): self._reply(200, {"status": "ok"})
+            def do_POST(self):
+                try: payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                except ValueError: self._reply(400, {"error": "invalid json"}); return
+                time.sleep(stub.latency)
+                if self.path == '/chat': self._reply(200, stub.respond(payload))
+                elif self.path == '/reset': stub.histories.pop(payload.get('user_id'), None); self._reply(200, {"status": "reset"})
+                else: self._reply(404, {"error": "not found"})
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8'); self.send_response(status); self.send_header('Content-Type', 'application/json'); self.send_header('Content-Length', str(len(data))); self.end_headers(); self.wfile.write(data)
+            def log_message(self, *args): pass
+        self.server = ThreadingHTTPServer((host, port), Handler); self.url = f"http://{host}:{self.server.server_port}"
+    def respond(self, payload):
+        message = payload.get('message', ''); self.histories.setdefault(payload.get('user_id'), []).append(message)
+        for keyword, response in self.canned.items():
+            if keyword in message.lower(): return response
+        return {"action": "chat", "spoken_response": f"You said: {message}."}
+    def start(self): Thread(target=self.server.serve_forever, daemon=True).start(); return self
+    def stop(self): self.server.shutdown(); self.server.server_close()
+
+
+class BenchmarkConfig(configparser.ConfigParser):
+    def setdefaults(self, section, keyvalues):
+        if not self.has_section(section): self.add_section(section)
+        for key, value in keyvalues.items():
+            if not self.has_option(section, key): self.set(section, key, str(value))
+class BenchmarkHost:
+    def __init__(self, nlu_url, local_intents=False):
+        self.config = BenchmarkConfig(); main.VoiceAssistantApp.build_config(self, self.config)
+        for section, key, value in (('nlu_server', 'active_backend', 'Local'), ('nlu_server', 'local_url', nlu_url), ('nlu_server', 'local_intents', str(int(local_intents))), ('audio', 'tts_streaming', '1')): self.config.set(section, key, value)
+    def add_log(self, message): Logger.debug(f"Benchmark: {message}")
+    def launch_app_picker(self, app_name_guess): pass
+    def open_accessibility_settings(self): pass
+
+
+def resample(audio, rate, target_rate=SAMPLE_RATE):
+    if rate == target_rate: return audio
+    positions = np.arange(int(len(audio) * target_rate / rate)) * rate / target_rate
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.int16)
+def load_wav(path):
+    with wave.open(path, 'rb') as wav: channels, width, rate, raw = wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.readframes(wav.getnframes())
+    if width != 2: raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+    return resample(np.frombuffer(raw, dtype=np.int16).reshape(-1, channels)[:, 0], rate)
+def synthesize_prompt(voice, text):
+    pcm = np.frombuffer(b"".join(getattr(chunk, 'audio_int16_bytes', chunk) for chunk in voice.synthesize(text)), dtype=np.int16)
+    return resample(pcm, getattr(voice.config, 'sample_rate', SAMPLE_RATE))
+def percentiles(values): return {"p50": round(float(np.percentile(values, 50)), 3), "p95": round(float(np.percentile(values, 95)), 3), "mean": round(float(np.mean(values)), 3)} if values else {}
+
+
+def run_turn(processor, capture, tracer, audio, timeout=30.0):
+    done, result = Event(), {}
+    def _on_result(response): tracer.mark('ui_callback'); result['response'] = response; done.set()
+    def _recognizing(): return processor.active and processor.recognition_thread is not None and processor.recognition_thread.is_alive()
+    tracer.begin(); processor.start_listening(_on_result)
+    trailing = np.zeros(int(SAMPLE_RATE * (processor.app.config.getint('audio', 'trailing_silence_ms') / 1000 + 0.6)), dtype=np.int16)
+    for samples in (audio, trailing):
+        for i in range(0, len(samples), capture.blocksize):
+            if not _recognizing(): break
+            capture.feed(samples[i:i + capture.blocksize]); subscription = processor.subscription
+            while _recognizing() and subscription and capture.position - subscription.position > capture.capacity // 2: time.sleep(0.001)
+    deadline = time.monotonic() + timeout
+    while not done.is_set() and time.monotonic() < deadline: Clock.tick()
+    processor.stop_listening(); trace = tracer.finish()
+    if not done.is_set(): Logger.warning("Benchmark: Turn timed out")
+    return trace, result.get('response')
+
+
+def benchmark_language(lang_code, utterances, nlu_url, repeat=1, local_intents=False):
+    host = BenchmarkHost(nlu_url, local_intents); capture, tracer, player = AudioCaptureEngine(live=False), TurnTracer(enabled=True), NullAudioPlayer()
+    models = ModelManager(memory_budget_mb=4096); nlu = NetworkNLUProcessor(lambda: nlu_url, host.config.getfloat('nlu_server', 'connect_timeout'), host.config.getfloat('nlu_server', 'read_timeout'))
+    processor = CommandProcessor(nlu, host, capture, models, tracer=tracer); processor.tts_player = player
+    start = time.monotonic(); processor.set_language(lang_code); load_ms = (time.monotonic() - start) * 1000
+    if not processor.stt_recognizer or not processor.tts_voice: nlu.close(); return {"error": f"Models for '{lang_code}' could not be loaded"}
+    if utterances is None: utterances = [(f"prompt:{text}", synthesize_prompt(processor.tts_voice, text)) for text in BENCHMARK_PROMPTS[lang_code]]
+    traces, turns, stt_speed, tts_speed, wall_start = [], [], [], [], time.monotonic()
+    for _ in range(repeat):
+        for name, audio in utterances:
+            samples_before = player.samples_played; trace, response = run_turn(processor, capture, tracer, audio)
+            stages, audio_seconds, speech_seconds = trace['stages'], len(audio) / SAMPLE_RATE, (player.samples_played - samples_before) / processor._tts_sample_rate()
+            if 'stt_final' in stages and 'first_command_frame' in stages: stt_speed.append(audio_seconds / max(1e-3, (stages['stt_final'] - stages['first_command_frame']) / 1000))
+            if 'playback_end' in stages and 'nlu_received' in stages and speech_seconds: tts_speed.append(speech_seconds / max(1e-3, (stages['playback_end'] - stages['nlu_received']) / 1000))
+            traces.append(trace); turns.append({"input": name, "audio_seconds": round(audio_seconds, 2), "response": response, "stages_ms": stages, "served_locally": trace.get('served_locally', False)})
+    wall_seconds = time.monotonic() - wall_start; nlu.close()
+    return {"model_load_ms": round(load_ms, 1), "turns": len(turns), "wall_seconds": round(wall_seconds, 2), "turns_per_second": round(len(turns) / wall_seconds, 3) if wall_seconds else None,
+            "stages_ms": TurnTracer.summarize(traces), "stt_realtime_factor": percentiles(stt_speed), "tts_realtime_factor": percentiles(tts_speed), "turn_details": turns}
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Headless replay benchmark for the STT -> NLU -> TTS pipeline.")
+    parser.add_argument('--langs', nargs='+', default=['en', 'hi'], choices=['en', 'hi'], help="Languages to benchmark.")
+    parser.add_argument('--wav-dir', help="Directory with <lang>/*.wav recordings. Without it, prompts are synthesized with the Piper voice of each language.")
+    parser.add_argument('--repeat', type=int, default=3, help="Times each utterance is replayed.")
+    parser.add_argument('--nlu-latency-ms', type=float, default=50, help="Artificial latency of the stub NLU server.")
+    parser.add_argument('--canned', help="JSON file mapping message keywords to canned NLU responses.")
+    parser.add_argument('--local-intents', action='store_true', help="Let the local intent matcher answer before the stub server.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON results.")
+    args = parser.parse_args(argv)
+    canned = None
+    if args.canned:
+        with open(args.canned) as f: canned = json.load(f)
+    stub = StubNLUServer(args.nlu_latency_ms, canned).start()
+    results = {"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "python": py_platform.python_version(), "machine": py_platform.machine(), "nlu_latency_ms": args.nlu_latency_ms, "repeat": args.repeat, "languages": {}}
+    try:
+        for lang_code in args.langs:
+            utterances = [(os.path.basename(path), load_wav(path)) for path in sorted(glob.glob(os.path.join(args.wav_dir, lang_code, '*.wav')))] if args.wav_dir else None
+            if utterances == []: results["languages"][lang_code] = {"error": f"No WAV files in {os.path.join(args.wav_dir, lang_code)}"}; continue
+            results["languages"][lang_code] = benchmark_language(lang_code, utterances, stub.url, args.repeat, args.local_intents)
+    finally: stub.stop()
+    with open(args.output, 'w') as f: json.dump(results, f, indent=2, ensure_ascii=False)
+    for lang_code, result in results["languages"].items():
+        if "error" in result: print(f"[{lang_code}] ERROR: {result['error']}"); continue
+        print(f"[{lang_code}] {result['turns']} turns, {result['turns_per_second']} turns/s, STT x{result['stt_realtime_factor'].get('p50')} realtime, TTS x{result['tts_realtime_factor'].get('p50')} realtime")
+        for stage, stat in result["stages_ms"].items(): print(f"    {stage:<20} p50 {stat['p50']:>8.1f} ms   p95 {stat['p95']:>8.1f} ms")
+    print(f"Results written to {args.output}")
+    return 1 if any("error" in result for result in results["languages"].values()) else 0
+
+if __name__ == '__main__': sys.exit(main_cli())
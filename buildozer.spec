@@ -4,6 +4,7 @@ package.name = assistant
 package.domain = org.test
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,ttf,json,pv,ppn,onnx,env
+source.exclude_dirs = tests
 version = 1.0
 requirements = python3,kivy==2.2.1,pyjnius==1.6.1,cython==0.29.36,android,requests,numpy,sounddevice,vosk,pvporcupine,piper-tts,python-dotenv,certifi,openssl
 orientation = portrait
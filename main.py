@@ -1,47 +1,85 @@
 # main.py
 
 import os
+import sys
 import time
 import json
+from contextlib import contextmanager
+
+class StartupProfile:
+    def __init__(self): self.origin, self.imports, self.loads, self.stages = time.monotonic(), {}, {}, {}
+    @contextmanager
+    def timed(self, bucket, name):
+        start = time.monotonic()
+        try: yield
+        finally: bucket.setdefault(name, round((time.monotonic() - start) * 1000, 1))
+    def importing(self, name): return self.timed(self.imports, name)
+    def loading(self, name): return self.timed(self.loads, name)
+    def stage(self, name): self.stages.setdefault(name, round((time.monotonic() - self.origin) * 1000, 1))
+    def as_dict(self): return {"imports_ms": self.imports, "model_loads_ms": self.loads, "stages_ms": dict(sorted(self.stages.items(), key=lambda item: item[1]))}
+STARTUP_PROFILE = StartupProfile()
+PROFILE_STARTUP = '--profile-startup' in sys.argv
+if PROFILE_STARTUP: sys.argv.remove('--profile-startup')
+
+import re
 import uuid
-import requests
-import numpy as np
-from threading import Thread, Lock
+import hashlib
+import difflib
+with STARTUP_PROFILE.importing('requests'):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+with STARTUP_PROFILE.importing('numpy'): import numpy as np
+from threading import Thread, Lock, Event, Condition, Timer
+from queue import Queue
 from functools import partial
 
-from kivy.app import App
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.label import Label
-from kivy.uix.button import Button
-from kivy.uix.scrollview import ScrollView
-from kivy.clock import Clock
-from kivy.utils import platform
-from kivy.logger import Logger
-from dotenv import dotenv_values
-from kivy.uix.settings import SettingsWithSidebar
-from kivy.uix.modalview import ModalView
-from kivy.uix.recycleview import RecycleView
-from kivy.uix.recycleview.views import RecycleDataViewBehavior
-from kivy.properties import BooleanProperty
-from kivy.uix.recycleboxlayout import RecycleBoxLayout
-from kivy.uix.behaviors import FocusBehavior
-from kivy.uix.recycleview.layout import LayoutSelectionBehavior
+with STARTUP_PROFILE.importing('kivy'):
+    from kivy.app import App
+    from kivy.uix.boxlayout import BoxLayout
+    from kivy.uix.label import Label
+    from kivy.uix.button import Button
+    from kivy.uix.scrollview import ScrollView
+    from kivy.clock import Clock
+    from kivy.utils import platform
+    from kivy.logger import Logger
+    from kivy.uix.settings import SettingsWithSidebar
+    from kivy.uix.modalview import ModalView
+    from kivy.uix.recycleview import RecycleView
+    from kivy.uix.recycleview.views import RecycleDataViewBehavior
+    from kivy.properties import BooleanProperty
+    from kivy.uix.recycleboxlayout import RecycleBoxLayout
+    from kivy.uix.behaviors import FocusBehavior
+    from kivy.uix.recycleview.layout import LayoutSelectionBehavior
+with STARTUP_PROFILE.importing('dotenv'): from dotenv import dotenv_values
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 dotenv_path = os.path.join(APP_ROOT, '.env')
 config = dotenv_values(dotenv_path)
 PICOVOICE_ACCESS_KEY = config.get("PICOVOICE_ACCESS_KEY")
 
-try: import pvporcupine
-except ImportError: pvporcupine = None
-try:
-    from vosk import Model, KaldiRecognizer, SetLogLevel
-    SetLogLevel(-1)
-except ImportError: Model, KaldiRecognizer = None, None
-try: import piper
-except ImportError: piper = None
-try: import sounddevice as sd
-except Exception: sd = None
+with STARTUP_PROFILE.importing('pvporcupine'):
+    try: import pvporcupine
+    except ImportError: pvporcupine = None
+with STARTUP_PROFILE.importing('sounddevice'):
+    try: import sounddevice as sd
+    except Exception: sd = None
+Model, KaldiRecognizer, piper, ml_backends_loaded, ml_backends_lock = None, None, None, False, Lock()
+def load_ml_backends():
+    global Model, KaldiRecognizer, piper, ml_backends_loaded
+    with ml_backends_lock:
+        if ml_backends_loaded: return
+        with STARTUP_PROFILE.importing('vosk'):
+            try:
+                from vosk import Model, KaldiRecognizer, SetLogLevel
+                SetLogLevel(-1)
+            except ImportError: Model, KaldiRecognizer = None, None
+        with STARTUP_PROFILE.importing('piper'):
+            try: import piper
+            except ImportError: piper = None
+        ml_backends_loaded = True
 
 if platform == 'android':
     try:
@@ -50,13 +88,16 @@ if platform == 'android':
     except ImportError: autoclass, Permission = None, None
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__)); ASSETS_DIR = os.path.join(APP_ROOT, 'assets')
-VoskModelEN, VoskModelHI, PiperVoiceEN, PiperVoiceHI = None, None, None, None
 PORCUPINE_MODEL_PATH = os.path.join(ASSETS_DIR, 'porcupine', 'porcupine_params.pv')
 PORCUPINE_KEYWORD_PATHS = [os.path.join(ASSETS_DIR, 'porcupine', 'hey-bro_en_android_v3_0_0.ppn')]
 VOSK_MODEL_PATH_EN = os.path.join(ASSETS_DIR, 'vosk', 'vosk-model-small-en-us-0.15'); VOSK_MODEL_PATH_HI = os.path.join(ASSETS_DIR, 'vosk', 'vosk-model-small-hi-0.22')
-PIPER_VOICE_EN_ONNX = os.path.join(ASSETS_DIR, 'piper', 'en_US-lessac-medium.onnx'); PIPER_VOICE_EN_JSON = os.path.join(ASSETS_DIR, 'piper', 'en_US-lessac-medium.onnx.json')
-PIPER_VOICE_HI_ONNX = os.path.join(ASSETS_DIR, 'piper', 'hi_IN-cmu-medium.onnx'); PIPER_VOICE_HI_JSON = os.path.join(ASSETS_DIR, 'piper', 'hi_IN-cmu-medium.onnx.json')
+PIPER_VOICE_EN_ONNX = os.path.join(ASSETS_DIR, 'piper', 'en_US-amy-medium.onnx'); PIPER_VOICE_EN_JSON = os.path.join(ASSETS_DIR, 'piper', 'en_US-amy-medium.onnx.json')
+PIPER_VOICE_HI_ONNX = os.path.join(ASSETS_DIR, 'piper', 'hi_IN-pratham-medium.onnx'); PIPER_VOICE_HI_JSON = os.path.join(ASSETS_DIR, 'piper', 'hi_IN-pratham-medium.onnx.json')
 SAMPLE_RATE = 16000; audio_lock = Lock()
+CANNED_RESPONSES = ("NLU server not configured.", "Failed to connect. Check server status and settings.", "I'm not sure.", "I couldn't open that app.", "I couldn't start a web search.", "I couldn't interact with the VPN app.",
+                    "I couldn't make the call. Do I have permission?", "I can't access contacts yet, please provide a number.", "Your phone is currently ringing.", "You are currently in a call.", "Your phone is not in a call.", "I couldn't check the phone status. Do I have permission?")
+
+def split_sentences(text): return [s for s in re.split(r'(?<=[.!?।])\s+', (text or "").strip()) if s]
 
 
 class SelectableLabel(RecycleDataViewBehavior, Label):
@@ -85,9 +126,105 @@ class AppListView(ModalView):
         self.add_widget(layout)
     def confirm(self, instance):
         if self.rv.layout_manager.selected_app_data: self.dismiss(); self.callback(self.rv.layout_manager.selected_app_data['app_data'])
+class TurnTracer:
+    STAGES = ('wake_detected', 'first_command_frame', 'stt_final', 'nlu_sent', 'nlu_received', 'tts_first_chunk', 'playback_end', 'ui_callback')
+    def __init__(self, trace_path=None, enabled=False, max_bytes=512 * 1024): self.trace_path, self.enabled, self.max_bytes, self.current = trace_path, enabled, max_bytes, None; self._lock = Lock()
+    def begin(self, timestamp=None):
+        if not self.enabled: return None
+        if self.current: self.finish()
+        self.current = {'trace_id': uuid.uuid4().hex[:12], 'started': time.time(), 'stages': {'wake_detected': timestamp or time.monotonic()}}
+        return self.current['trace_id']
+    def mark(self, stage, trace_id=None, **fields):
+        trace = self.current
+        if trace is None or trace_id not in (None, trace['trace_id']): return
+        trace['stages'].setdefault(stage, time.monotonic()); trace.update(fields)
+    def finish(self):
+        trace, self.current = self.current, None
+        if trace is None: return None
+        origin = trace['stages']['wake_detected']; trace['stages'] = {stage: round((t - origin) * 1000, 1) for stage, t in trace['stages'].items()}
+        if not self.trace_path: return trace
+        with self._lock:
+            try:
+                if os.path.exists(self.trace_path) and os.path.getsize(self.trace_path) > self.max_bytes: os.replace(self.trace_path, self.trace_path + '.1')
+                with open(self.trace_path, 'a') as f: f.write(json.dumps(trace) + '\n')
+            except Exception as e: Logger.error(f"TurnTracer: Failed to write trace: {e}")
+        return trace
+    @classmethod
+    def summarize(cls, traces):
+        durations = {stage: [] for stage in cls.STAGES[1:]}
+        for trace in traces:
+            stages, previous = trace['stages'], 0.0
+            for stage in cls.STAGES[1:]:
+                if stage in stages: durations[stage].append(stages[stage] - previous); previous = stages[stage]
+        return {stage: {"p50": round(float(np.percentile(values, 50)), 1), "p95": round(float(np.percentile(values, 95)), 1), "mean": round(float(np.mean(values)), 1), "count": len(values)} for stage, values in durations.items() if values}
+    def stage_percentiles(self):
+        traces = []
+        for path in (f"{self.trace_path}.1", self.trace_path) if self.trace_path else ():
+            if not os.path.exists(path): continue
+            with open(path) as f:
+                for line in f:
+                    try: traces.append(json.loads(line))
+                    except Exception: continue
+        return self.summarize(traces)
+class VoiceActivityEndpointer:
+    def __init__(self, energy_threshold=500, trailing_silence_ms=700, max_utterance_ms=8000, frame_ms=20, min_speech_ratio=0.3, max_zero_crossing_rate=0.35):
+        self.energy_threshold, self.trailing_silence_ms, self.max_utterance_ms, self.frame = energy_threshold, trailing_silence_ms, max_utterance_ms, int(SAMPLE_RATE * frame_ms / 1000)
+        self.min_speech_ratio, self.max_zero_crossing_rate = min_speech_ratio, max_zero_crossing_rate; self.elapsed_ms, self.silence_ms, self.speech_started = 0, 0, False
+    def is_speech(self, block):
+        frames = block[:len(block) // self.frame * self.frame].reshape(-1, self.frame).astype(np.float32)
+        rms, zcr = np.sqrt(np.mean(frames * frames, axis=1)), np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        return bool(np.mean((rms > self.energy_threshold) & (zcr < self.max_zero_crossing_rate)) >= self.min_speech_ratio)
+    def update(self, block):
+        block_ms = len(block) * 1000 / SAMPLE_RATE; speech = self.is_speech(block); self.elapsed_ms += block_ms
+        if speech: self.speech_started, self.silence_ms = True, 0
+        elif self.speech_started: self.silence_ms += block_ms
+        if self.speech_started and self.silence_ms >= self.trailing_silence_ms: return speech, 'silence'
+        return speech, 'max_utterance' if self.elapsed_ms >= self.max_utterance_ms else None
+class AudioSubscription:
+    def __init__(self, engine, block_size, position): self.engine, self.block_size, self.position, self.closed = engine, block_size, position, False
+    def read(self, timeout=0.5): return self.engine._read(self, timeout)
+    def close(self): self.engine.unsubscribe(self)
+class AudioCaptureEngine:
+    def __init__(self, sample_rate=SAMPLE_RATE, capacity_seconds=10, blocksize=512, max_block=int(SAMPLE_RATE * 0.2), live=True):
+        self.sample_rate, self.blocksize, self.capacity, self.max_block, self.live = sample_rate, blocksize, int(sample_rate * capacity_seconds), max_block, live
+        self.buffer = np.zeros(self.capacity + max_block, dtype=np.int16); self.position, self.stream_start, self.stream, self.subscribers = 0, 0, None, []; self._cond = Condition()
+    def _store(self, index, samples):
+        self.buffer[index:index + len(samples)] = samples
+        if index < self.max_block: mirror = min(len(samples), self.max_block - index); self.buffer[self.capacity + index:self.capacity + index + mirror] = samples[:mirror]
+    def _audio_callback(self, indata, frames, time_info, status): self.feed(indata[:, 0])
+    def feed(self, samples):
+        frames = len(samples); start = self.position % self.capacity; first = min(frames, self.capacity - start)
+        self._store(start, samples[:first])
+        if first < frames: self._store(0, samples[first:])
+        with self._cond: self.position += frames; self._cond.notify_all()
+    def _read(self, sub, timeout):
+        with self._cond:
+            if not self._cond.wait_for(lambda: sub.closed or self.position - sub.position >= sub.block_size, timeout) or sub.closed: return None
+            if self.position - sub.position > self.capacity - self.max_block: Logger.warning(f"AudioCapture: Subscriber overrun, skipping {self.position - sub.position - sub.block_size} samples"); sub.position = self.position - sub.block_size
+            index = sub.position % self.capacity; sub.position += sub.block_size
+        return self.buffer[index:index + sub.block_size]
+    def recent(self, count, end_position=None):
+        count = min(count, self.max_block, self.position - self.stream_start); end = self.position if end_position is None else min(end_position, self.position)
+        index = (end - count) % self.capacity; return self.buffer[index:index + count]
+    def subscribe(self, block_size, start_position=None, preroll=0):
+        if block_size > self.max_block: raise ValueError(f"Block size {block_size} exceeds ring buffer maximum {self.max_block}")
+        with self._cond:
+            if not self.stream and self.live:
+                with audio_lock: self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16', blocksize=self.blocksize, callback=self._audio_callback); self.stream.start()
+                self.stream_start = self.position
+            start = (self.position if start_position is None else start_position) - preroll
+            sub = AudioSubscription(self, block_size, min(self.position, max(start, self.stream_start, self.position - self.capacity + self.max_block))); self.subscribers.append(sub)
+            return sub
+    def unsubscribe(self, sub):
+        with self._cond:
+            sub.closed = True; self._cond.notify_all()
+            if sub in self.subscribers: self.subscribers.remove(sub)
+            if self.subscribers or not self.stream: return
+            stream, self.stream = self.stream, None
+        with audio_lock: stream.stop(); stream.close()
 class WakeWordListener(Thread):
-    def __init__(self, access_key, keyword_paths, model_path, callback, sensitivity=0.5):
-        super().__init__(daemon=True); self.callback = callback; self._running = False; self.porcupine = None; self.stream = None
+    def __init__(self, access_key, keyword_paths, model_path, callback, capture_engine, sensitivity=0.5):
+        super().__init__(daemon=True); self.callback, self.capture = callback, capture_engine; self._running = False; self.porcupine = None; self.subscription = None
         if not all([pvporcupine, sd, access_key, keyword_paths, model_path]): return
         try:
             self.porcupine = pvporcupine.create(access_key=access_key, keyword_paths=keyword_paths, model_path=model_path, sensitivities=[sensitivity] * len(keyword_paths))
@@ -97,81 +234,460 @@ class WakeWordListener(Thread):
         if not self.porcupine: return
         self._running = True
         try:
-            with audio_lock: self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16', blocksize=self.frame_length); self.stream.start()
+            self.subscription = self.capture.subscribe(self.frame_length)
             while self._running:
-                pcm = self.stream.read(self.frame_length)[0]
-                if not self._running: break
-                if self.porcupine.process(pcm[:, 0]) >= 0: Clock.schedule_once(lambda dt: self.callback())
+                pcm = self.subscription.read()
+                if pcm is None or not self._running: continue
+                if self.porcupine.process(pcm) >= 0: Clock.schedule_once(lambda dt, position=self.subscription.position, detected_at=time.monotonic(): self.callback(position, detected_at))
         except Exception as e: Logger.error(f"WakeWordListener: Audio stream error: {e}")
         finally:
-            with audio_lock:
-                if self.stream: self.stream.stop(); self.stream.close()
-            self._running = False
-    def stop(self): self._running = False;
-    if self.porcupine: self.porcupine.delete()
+            if self.subscription: self.subscription.close()
+            self._running = False; self.porcupine.delete()
+    def stop(self):
+        self._running = False
+        if self.subscription: self.subscription.close()
 class NetworkNLUProcessor:
-    def __init__(self, get_url_callback): self.get_url = get_url_callback; self.user_id = str(uuid.uuid4())
+    HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+    def __init__(self, get_url_callback, connect_timeout=5, read_timeout=60, max_workers=3, get_backends_callback=None, probe_interval=30):
+        self.get_url, self.get_backends = get_url_callback, get_backends_callback or (lambda: None); self.user_id = str(uuid.uuid4()); self.timeout = (connect_timeout, read_timeout)
+        self.health, self.history_backends, self.probe_interval, self._stop_probing = {}, set(), probe_interval, Event()
+        self.session = requests.Session(); self.session.headers.update(self.HEADERS)
+        retry = Retry(total=2, connect=2, read=0, status=1, backoff_factor=0.3, status_forcelist=(503,), allowed_methods=frozenset(['POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=3, pool_maxsize=max_workers, max_retries=retry); self.session.mount('http://', adapter); self.session.mount('https://', adapter)
+        self.max_workers, self.executor = max_workers, ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nlu'); self.pending, self.generation, self.timings, self.pool_connections = set(), 0, deque(maxlen=50), {}; self._lock = Lock()
+    def _submit(self, fn):
+        with self._lock: future = self.executor.submit(fn, self.generation); self.pending.add(future)
+        future.add_done_callback(lambda f: self.pending.discard(f)); return future
+    def _post(self, endpoint, payload, timeout):
+        start = time.monotonic(); response = self.session.post(endpoint, json=payload, timeout=timeout)
+        pool = getattr(response.raw, '_pool', None); connections = getattr(pool, 'num_connections', 0)
+        with self._lock: new_connection = connections > self.pool_connections.get(id(pool), 0); self.pool_connections[id(pool)] = connections
+        timing = {"endpoint": endpoint, "status": response.status_code, "total_ms": round((time.monotonic() - start) * 1000, 1), "server_ms": round(response.elapsed.total_seconds() * 1000, 1), "new_connection": new_connection}
+        self.timings.append(timing); Logger.info(f"NLU Client: {timing}"); response.raise_for_status()
+        return response
+    def cancel_pending(self):
+        with self._lock:
+            self.generation += 1; self._abandon([future for future in list(self.pending) if not future.cancel() and not future.done()])
+    def _abandon(self, running):
+        if not running: return
+        self.executor.shutdown(wait=False); self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='nlu'); Logger.info(f"NLU Client: Abandoned {len(running)} in-flight request(s) to a fresh worker pool")
+    def _health(self, base_url): return self.health.setdefault(base_url, {'latency': deque(maxlen=20), 'chat_latency': deque(maxlen=50), 'errors': deque(maxlen=20)})
+    def _record(self, base_url, latency, chat=False):
+        health = self._health(base_url); health['errors'].append(latency is None)
+        if latency is not None: health['chat_latency' if chat else 'latency'].append(latency)
+    def score(self, base_url):
+        health = self._health(base_url); latency = float(np.median(health['latency'])) if health['latency'] else 1.0
+        return latency + 10.0 * (sum(health['errors']) / len(health['errors']) if health['errors'] else 0.0)
+    def rank_backends(self): return sorted(self.get_backends() or [], key=self.score)
+    def hedge_delay(self, base_url):
+        samples = self._health(base_url)['chat_latency']
+        return max(0.3, float(np.percentile(samples, 95))) if len(samples) >= 5 else 3.0
+    def probe_backends(self):
+        for base_url in self.get_backends() or []:
+            start = time.monotonic()
+            try: response = self.session.get(base_url, timeout=(self.timeout[0], 3)); self._record(base_url, time.monotonic() - start if response.status_code < 500 else None)
+            except Exception as e: Logger.warning(f"NLU Router: Probe of {base_url} failed: {e}"); self._record(base_url, None)
+    def start_probing(self):
+        def _probe_loop():
+            while True:
+                try: self.probe_backends()
+                except Exception as e: Logger.error(f"NLU Router: Probe loop error: {e}")
+                if self._stop_probing.wait(self.probe_interval): return
+        Thread(target=_probe_loop, daemon=True, name='nlu-probe').start()
+    def _route_chat(self, text, callback):
+        ranked = self.rank_backends()[:2]; turn = {'done': False, 'launched': 0, 'failed': 0, 'timer': None, 'generation': self.generation, 'futures': {}}
+        def _finish(response_json, base_url):
+            with self._lock:
+                if turn['done']: return
+                turn['done'] = True
+                if turn['timer']: turn['timer'].cancel()
+                self._abandon([future for url, future in turn['futures'].items() if url != base_url and not future.cancel() and not future.done()])
+            if turn['generation'] == self.generation: Clock.schedule_once(lambda dt: callback(response_json))
+        def _attempt(base_url, generation):
+            start = time.monotonic()
+            try: response_json = self._post(f"{base_url}/chat", {"message": text, "user_id": self.user_id}, self.timeout).json(); self._record(base_url, time.monotonic() - start, chat=True); _finish(response_json, base_url)
+            except Exception as e:
+                Logger.error(f"NLU Router: Request to {base_url} failed: {e}"); self._record(base_url, None)
+                with self._lock: turn['failed'] += 1; exhausted = turn['failed'] >= len(ranked)
+                if exhausted: _finish({"action": "chat", "spoken_response": "Failed to connect. Check server status and settings."}, base_url)
+                else: _launch()
+        def _launch():
+            with self._lock:
+                if turn['done'] or turn['launched'] >= len(ranked) or turn['generation'] != self.generation: return
+                base_url = ranked[turn['launched']]; turn['launched'] += 1; self.history_backends.add(base_url)
+            if turn['launched'] > 1: Logger.info(f"NLU Router: Hedging request to {base_url}")
+            future = self._submit(partial(_attempt, base_url))
+            with self._lock:
+                turn['futures'][base_url] = future
+                if turn['done'] and not future.cancel() and not future.done(): self._abandon([future])
+        _launch()
+        if len(ranked) > 1: turn['timer'] = Timer(self.hedge_delay(ranked[0]), _launch); turn['timer'].daemon = True; turn['timer'].start()
     def get_endpoints(self):
         base_url = self.get_url()
         if not base_url or not base_url.startswith('http'): return None, None
         return f"{base_url}/chat", f"{base_url}/reset"
     def process_text(self, text, callback):
+        if self.get_backends(): self._route_chat(text, callback); return
         chat_endpoint, _ = self.get_endpoints()
         if not chat_endpoint: Clock.schedule_once(lambda dt: callback({"action": "chat", "spoken_response": "NLU server not configured."})); return
-        def _send_request():
-            payload, headers = {"message": text, "user_id": self.user_id}, {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        def _send_request(generation):
             response_json = {"action": "chat", "spoken_response": "Error connecting to NLU server."}
-            try:
-                response = requests.post(chat_endpoint, headers=headers, json=payload, timeout=60); response.raise_for_status()
-                response_json = response.json()
+            try: response_json = self._post(chat_endpoint, {"message": text, "user_id": self.user_id}, self.timeout).json()
             except Exception as e: Logger.error(f"NLU Client: Request to {chat_endpoint} failed: {e}"); response_json["spoken_response"] = "Failed to connect. Check server status and settings."
-            finally: Clock.schedule_once(lambda dt: callback(response_json))
-        Thread(target=_send_request, daemon=True).start()
+            finally:
+                if generation == self.generation: Clock.schedule_once(lambda dt: callback(response_json))
+                else: Logger.info(f"NLU Client: Dropped cancelled response from {chat_endpoint}")
+        self._submit(_send_request)
     def reset_history(self):
-        _, reset_endpoint = self.get_endpoints()
-        if not reset_endpoint: return
-        def _send_reset():
-            try: requests.post(reset_endpoint, headers={'Content-Type': 'application/json'}, json={"user_id": self.user_id}, timeout=10)
-            except Exception as e: Logger.error(f"NLU Client: Failed to send reset request: {e}")
-        Thread(target=_send_reset, daemon=True).start()
+        self.cancel_pending(); _, reset_endpoint = self.get_endpoints()
+        if self.get_backends(): reset_endpoints = [f"{base_url}/reset" for base_url in self.history_backends]; self.history_backends.clear()
+        else: reset_endpoints = [reset_endpoint] if reset_endpoint else []
+        for endpoint in reset_endpoints:
+            def _send_reset(generation, endpoint=endpoint):
+                try: self._post(endpoint, {"user_id": self.user_id}, (self.timeout[0], 10))
+                except Exception as e: Logger.error(f"NLU Client: Failed to send reset request to {endpoint}: {e}")
+            self._submit(_send_reset)
+    def close(self): self._stop_probing.set(); self.cancel_pending(); self.executor.shutdown(wait=False); self.session.close()
+class NullAudioPlayer:
+    available = True
+    def __init__(self): self.samples_played = 0
+    def play(self, pcm_chunks, sample_rate, start_time=None):
+        start, first_audio = start_time or time.monotonic(), None
+        for pcm in pcm_chunks:
+            if first_audio is None: first_audio = time.monotonic() - start
+            self.samples_played += len(pcm) // 2 if isinstance(pcm, bytes) else len(pcm)
+        return first_audio
+    def interrupt(self): pass
+    def recent_level(self, window=0.5): return 0.0
+    def close(self): pass
+class StreamingAudioPlayer:
+    @property
+    def available(self): return sd is not None
+    def __init__(self, max_queued_chunks=4, slice_size=512):
+        self.queue, self.stream, self.sample_rate, self._writer, self.slice_size = Queue(maxsize=max_queued_chunks), None, None, None, slice_size
+        self.turn, self.levels = None, deque(maxlen=64); self._play_lock = Lock()
+    def _ensure_stream(self, sample_rate):
+        if self.stream and self.sample_rate == sample_rate: return
+        self.close()
+        with audio_lock: self.stream = sd.OutputStream(samplerate=sample_rate, channels=1, dtype='int16'); self.stream.start(); self.sample_rate = sample_rate
+        if not self._writer or not self._writer.is_alive(): self._writer = Thread(target=self._write_loop, daemon=True); self._writer.start()
+    def _write_loop(self):
+        while True:
+            turn, pcm = self.queue.get()
+            if pcm is None: turn['done'].set(); continue
+            try:
+                if turn['first_audio'] is None: turn['first_audio'] = time.monotonic()
+                samples = np.frombuffer(pcm, dtype=np.int16)
+                for i in range(0, len(samples), self.slice_size):
+                    if turn['cancelled']: break
+                    frame = samples[i:i + self.slice_size]; self.levels.append((time.monotonic(), float(np.sqrt(np.mean(frame.astype(np.float32) ** 2))))); self.stream.write(frame)
+                if turn['cancelled'] and not turn['aborted']: turn['aborted'] = True; self.stream.abort(); self.stream.start()
+            except Exception as e: Logger.error(f"TTS Player: Output stream write failed: {e}")
+    def play(self, pcm_chunks, sample_rate, start_time=None):
+        with self._play_lock:
+            self._ensure_stream(sample_rate); turn = self.turn = {'start': start_time or time.monotonic(), 'first_audio': None, 'done': Event(), 'cancelled': False, 'aborted': False}
+            try:
+                for pcm in pcm_chunks:
+                    if turn['cancelled']: break
+                    if len(pcm): self.queue.put((turn, pcm))
+            finally: self.queue.put((turn, None)); turn['done'].wait(); self.turn = None
+            return turn['first_audio'] - turn['start'] if turn['first_audio'] else None
+    def interrupt(self):
+        turn = self.turn
+        if turn: turn['cancelled'] = True
+    def recent_level(self, window=0.5):
+        since = time.monotonic() - window; levels = [level for timestamp, level in list(self.levels) if timestamp >= since]
+        return max(levels) if levels else 0.0
+    def close(self):
+        with audio_lock:
+            if self.stream: self.stream.stop(); self.stream.close(); self.stream = None
+class SpeechCache:
+    MAX_TEXT_LENGTH = 200
+    def __init__(self, cache_dir, max_mb=50, hot_entries=16):
+        self.cache_dir, self.max_bytes, self.hot_entries, self.hot, self._lock = cache_dir, max_mb * 1024 * 1024, hot_entries, OrderedDict(), Lock(); os.makedirs(cache_dir, exist_ok=True)
+        entries = sorted((entry for entry in os.scandir(cache_dir) if entry.name.endswith('.npy')), key=lambda entry: entry.stat().st_mtime)
+        self.index = OrderedDict((entry.name[:-4], entry.stat().st_size) for entry in entries)
+    @staticmethod
+    def key(voice, text): return hashlib.sha1(f"{voice}\n{' '.join(text.split())}".encode('utf-8')).hexdigest()
+    def _path(self, key): return os.path.join(self.cache_dir, f"{key}.npy")
+    def _promote(self, key, pcm):
+        self.hot[key] = pcm; self.hot.move_to_end(key)
+        while len(self.hot) > self.hot_entries: self.hot.popitem(last=False)
+    def contains(self, voice, text): return self.key(voice, text) in self.index
+    def get(self, voice, text):
+        key = self.key(voice, text)
+        with self._lock:
+            if key not in self.index: return None
+            self.index.move_to_end(key)
+            if key in self.hot: self.hot.move_to_end(key); return self.hot[key]
+            try: pcm = np.load(self._path(key), mmap_mode='r'); os.utime(self._path(key))
+            except Exception as e: Logger.warning(f"SpeechCache: Dropping unreadable entry {key}: {e}"); self.index.pop(key, None); return None
+            self._promote(key, pcm); return pcm
+    def put(self, voice, text, pcm_bytes):
+        if len(text) > self.MAX_TEXT_LENGTH or not pcm_bytes: return
+        key, pcm = self.key(voice, text), np.frombuffer(pcm_bytes, dtype=np.int16)
+        with self._lock:
+            try:
+                with open(self._path(key) + '.tmp', 'wb') as f: np.save(f, pcm)
+                os.replace(self._path(key) + '.tmp', self._path(key))
+                mapped = np.load(self._path(key), mmap_mode='r')
+            except Exception as e: Logger.error(f"SpeechCache: Failed to store entry {key}: {e}"); return
+            self.index[key] = os.path.getsize(self._path(key)); self.index.move_to_end(key); self._promote(key, mapped); self._evict()
+    def _evict(self):
+        total = sum(self.index.values())
+        while total > self.max_bytes and len(self.index) > 1:
+            key, size = self.index.popitem(last=False); self.hot.pop(key, None); total -= size
+            try: os.remove(self._path(key))
+            except OSError: pass
+class ModelManager:
+    SOURCES = {('stt', 'en'): (VOSK_MODEL_PATH_EN, None), ('stt', 'hi'): (VOSK_MODEL_PATH_HI, None), ('tts', 'en'): (PIPER_VOICE_EN_ONNX, PIPER_VOICE_EN_JSON), ('tts', 'hi'): (PIPER_VOICE_HI_ONNX, PIPER_VOICE_HI_JSON)}
+    def __init__(self, memory_budget_mb=512):
+        self.budget = memory_budget_mb * 1024 * 1024; self.models, self.sizes, self.recognizers, self.pinned = OrderedDict(), {}, {}, set(); self._lock = Lock()
+    @staticmethod
+    def footprint(path):
+        if not os.path.exists(path): return 0
+        if os.path.isfile(path): return os.path.getsize(path)
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+    def used(self): return sum(self.sizes.values())
+    def is_resident(self, lang_code): return ('stt', lang_code) in self.models and ('tts', lang_code) in self.models
+    def _load(self, model_type, lang_code):
+        path, config_path = self.SOURCES[(model_type, lang_code)]
+        if not os.path.exists(path): return None
+        load_ml_backends()
+        with STARTUP_PROFILE.loading(f"{model_type}_{lang_code}"):
+            if model_type == 'stt': return Model(path) if Model else None
+            return piper.PiperVoice.load(path, config_path=config_path) if piper else None
+    def _evict(self, keep):
+        for key in list(self.models):
+            if self.used() <= self.budget: return
+            if key == keep or key[1] in self.pinned: continue
+            del self.models[key], self.sizes[key]; Logger.info(f"ModelManager: Evicted {key[0].upper()} model for '{key[1]}'")
+            if key[0] == 'stt': self.recognizers.pop(key[1], None)
+    def get(self, model_type, lang_code):
+        key = (model_type, lang_code)
+        with self._lock:
+            if key in self.models: self.models.move_to_end(key); return self.models[key]
+            try: model = self._load(model_type, lang_code)
+            except Exception as e: Logger.error(f"ModelManager: Failed to load {model_type} model for '{lang_code}': {e}"); return None
+            if model is None: return None
+            self.models[key], self.sizes[key] = model, self.footprint(self.SOURCES[key][0]); self._evict(keep=key); STARTUP_PROFILE.stage(f"{model_type}_{lang_code}_ready")
+            return model
+    def get_recognizer(self, lang_code):
+        if lang_code not in self.recognizers:
+            model = self.get('stt', lang_code)
+            if not model: return None
+            self.recognizers[lang_code] = KaldiRecognizer(model, SAMPLE_RATE)
+        return self.recognizers[lang_code]
+    def preload(self, lang_codes, progress_callback=None, done_callback=None):
+        steps = [(model_type, lang_code) for lang_code in dict.fromkeys(lang_codes) for model_type in ('stt', 'tts')]
+        def _preload():
+            for index, (model_type, lang_code) in enumerate(steps):
+                if lang_code not in self.pinned and not self.is_resident(lang_code) and self.used() + sum(self.footprint(path) for (_, lang), (path, _) in self.SOURCES.items() if lang == lang_code) > self.budget:
+                    Logger.info(f"ModelManager: Skipping preload of '{lang_code}', it does not fit the memory budget"); continue
+                if progress_callback: Clock.schedule_once(lambda dt, message=f"{model_type.upper()} {lang_code} {index + 1}/{len(steps)}": progress_callback(message))
+                if model_type == 'stt': self.get_recognizer(lang_code)
+                else: self.get(model_type, lang_code)
+            if done_callback: Clock.schedule_once(lambda dt: done_callback())
+        Thread(target=_preload, daemon=True).start()
+class BilingualRecognizer:
+    def __init__(self, recognizers, executor, preferred='en', margin=0.05, max_parallel_ms=3000, early_decision_ms=1000, early_margin=0.15):
+        self.recognizers, self.executor, self.preferred, self.margin, self.max_parallel_samples = recognizers, executor, preferred, margin, int(SAMPLE_RATE * max_parallel_ms / 1000)
+        self.early_samples, self.early_margin = int(SAMPLE_RATE * early_decision_ms / 1000), early_margin
+        for recognizer in recognizers.values():
+            recognizer.SetWords(True)
+            if hasattr(recognizer, 'SetPartialWords'): recognizer.SetPartialWords(True)
+        self.Reset()
+    def Reset(self): self.active, self.winner, self.samples, self.scores, self.texts, self._result = list(self.recognizers), None, 0, {}, [], {}
+    @staticmethod
+    def confidence(words): return sum(word.get('conf', 0.0) for word in words) / len(words) if words else 0.0
+    def _parallel(self, method, *args): return dict(zip(self.active, self.executor.map(lambda lang: getattr(self.recognizers[lang], method)(*args), self.active)))
+    def _biased_scores(self, results, words_key='result'):
+        self.scores = {lang: round(self.confidence(result.get(words_key, [])), 3) for lang, result in results.items()}
+        return {lang: score + (self.margin if lang == self.preferred else 0.0) for lang, score in self.scores.items()}
+    def _decide(self, biased, reason):
+        self.winner = max(biased, key=biased.get)
+        for lang in self.active:
+            if lang != self.winner: self.recognizers[lang].Reset()
+        self.active = [self.winner]; Logger.info(f"AutoLanguage: Picked '{self.winner}' after {self.samples * 1000 // SAMPLE_RATE} ms ({reason}), word confidence {self.scores}")
+    def _merge(self, result):
+        if result.get('text'): self.texts.append(result['text'])
+        self._result = {"text": " ".join(self.texts), "lang": self.winner, "scores": self.scores}; return self._result
+    def AcceptWaveform(self, data):
+        if self.winner:
+            finished = self.recognizers[self.winner].AcceptWaveform(data)
+            if finished: self._merge(json.loads(self.recognizers[self.winner].Result()))
+            return finished
+        self.samples += len(data) // 2; finished = self._parallel('AcceptWaveform', data)
+        if any(finished.values()):
+            results = dict(zip(self.active, self.executor.map(lambda lang: json.loads(self.recognizers[lang].Result() if finished[lang] else self.recognizers[lang].FinalResult()), self.active)))
+            self._decide(self._biased_scores(results), 'endpoint'); self._merge(results[self.winner]); return True
+        if self.samples >= self.early_samples:
+            partials = {lang: json.loads(raw) for lang, raw in self._parallel('PartialResult').items()}
+            biased = self._biased_scores(partials, 'partial_result'); leader, (first, second) = max(biased, key=biased.get), sorted(biased.values(), reverse=True)[:2]
+            if partials[leader].get('partial_result') and first - second >= self.early_margin: self._decide(biased, 'early')
+            elif self.samples >= self.max_parallel_samples: self._decide(biased, 'window')
+        return False
+    def Result(self): return json.dumps(self._result)
+    def FinalResult(self):
+        if self.winner: return json.dumps(self._merge(json.loads(self.recognizers[self.winner].FinalResult())))
+        results = {lang: json.loads(raw) for lang, raw in self._parallel('FinalResult').items()}
+        self._decide(self._biased_scores(results), 'final'); return json.dumps(self._merge(results[self.winner]))
+class LocalIntentMatcher:
+    DIGIT_WORDS = {'zero': '0', 'oh': '0', 'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5', 'six': '6', 'seven': '7', 'eight': '8', 'nine': '9'}
+    STATUS_PATTERN = re.compile(r'^(?:please )?(?:(?:what s|what is|check) (?:my |the )?)?(?:am i (?:in|on) a call|is my phone ringing|(?:phone|call) status)$')
+    OPEN_PATTERN = re.compile(r'^(?:please )?(?:open|launch|start) (?:the |my )?(?P<name>.+)$')
+    CALL_PATTERN = re.compile(r'^(?:please )?(?:call|dial|phone) (?P<number>.+)$')
+    SEARCH_PATTERN = re.compile(r'^(?:please )?(?:search (?:the web |google )?for|google|look up) (?P<query>.+)$')
+    PLAY_PATTERN = re.compile(r'^(?:please )?play (?P<query>.+?)(?: on youtube)?$')
+    MIN_CALL_DIGITS = 7
+    def __init__(self, fuzzy_cutoff=0.85): self.fuzzy_cutoff, self.apps, self.label_of = fuzzy_cutoff, {}, lambda package: None
+    @staticmethod
+    def normalize(text): return ' '.join(re.sub(r'[^\w\s]', ' ', (text or '').lower()).split())
+    @staticmethod
+    def compact(text): return re.sub(r'[\W_]', '', (text or '').lower())
+    def rebuild(self, custom_actions, label_of=None):
+        self.apps = {self.compact(name): (name, package) for name, package in custom_actions.items() if self.compact(name)}
+        if label_of: self.label_of = label_of
+    def match_app(self, name):
+        keys = [self.compact(name), self.compact(re.sub(r' app$', '', name))]
+        for key in keys:
+            if key in self.apps: return self.apps[key]
+        close = [match for key in keys for match in difflib.get_close_matches(key, self.apps.keys(), n=1, cutoff=self.fuzzy_cutoff)]
+        return self.apps[close[0]] if close else None
+    def parse_number(self, text):
+        digits = ''.join(self.DIGIT_WORDS.get(token, token) for token in text.split())
+        return digits if re.fullmatch(rf'\d{{{self.MIN_CALL_DIGITS},15}}', digits) else None
+    def match(self, transcript):
+        text = self.normalize(transcript)
+        if not text: return None
+        if self.STATUS_PATTERN.match(text): return "check_phone_status", {}, "I can only check the phone status on Android."
+        if (m := self.OPEN_PATTERN.match(text)) and (app := self.match_app(m.group('name'))):
+            name = self.label_of(app[1]) or app[0].title(); return "open_app", {"app_name": name, "package_name": app[1]}, f"Opening {name}."
+        if (m := self.CALL_PATTERN.match(text)) and (number := self.parse_number(m.group('number'))): return "make_call", {"number": number}, f"Calling {' '.join(number)}."
+        if m := self.SEARCH_PATTERN.match(text): return "web_search", {"query": m.group('query')}, f"Searching for {m.group('query')}."
+        if m := self.PLAY_PATTERN.match(text): return "play_media", {"query": m.group('query')}, f"Playing {m.group('query')}."
+        return None
+class StaticAppSource:
+    def __init__(self, apps=None): self.apps = dict(apps or {})
+    def list_launchable(self): return {package: package for package in self.apps}
+    def load_label(self, handle): return self.apps[handle]
+    def release_thread(self): pass
+class AndroidAppSource:
+    def list_launchable(self):
+        PythonActivity, Intent = autoclass('org.kivy.android.PythonActivity'), autoclass('android.content.Intent'); intent = Intent(Intent.ACTION_MAIN, None); intent.addCategory(Intent.CATEGORY_LAUNCHER)
+        launchable = {}
+        for app_info in PythonActivity.mActivity.getPackageManager().queryIntentActivities(intent, 0): launchable.setdefault(app_info.activityInfo.packageName, app_info)
+        return launchable
+    def load_label(self, handle): return handle.loadLabel(autoclass('org.kivy.android.PythonActivity').mActivity.getPackageManager()).toString()
+    def release_thread(self):
+        from jnius import detach
+        detach()
+class AppIndex:
+    def __init__(self, index_path, source):
+        self.index_path, self.source, self.refreshing, self.waiters = index_path, source, False, []; self._lock, self._waiters_lock = Lock(), Lock(); apps = {}
+        try:
+            if os.path.exists(index_path):
+                with open(index_path, 'r') as f: apps = json.load(f)
+        except Exception as e: Logger.warning(f"AppIndex: Ignoring unreadable index: {e}")
+        self.snapshot = (apps, self.build_trigrams(apps))
+    @property
+    def apps(self): return self.snapshot[0]
+    @property
+    def trigrams(self): return self.snapshot[1]
+    @staticmethod
+    def trigrams_of(text):
+        padded = f"  {LocalIntentMatcher.normalize(text)} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    @classmethod
+    def build_trigrams(cls, apps):
+        trigrams = {}
+        for package, name in apps.items():
+            for gram in cls.trigrams_of(name): trigrams.setdefault(gram, set()).add(package)
+        return trigrams
+    def refresh(self):
+        with self._lock:
+            launchable = self.source.list_launchable(); apps = {package: name for package, name in self.apps.items() if package in launchable}
+            added = [package for package in launchable if package not in apps]
+            for package in added:
+                try: apps[package] = self.source.load_label(launchable[package])
+                except Exception as e: Logger.warning(f"AppIndex: Could not load label for {package}: {e}")
+            if apps == self.apps: return False
+            self.snapshot = (apps, self.build_trigrams(apps)); Logger.info(f"AppIndex: {len(added)} added, {len(apps)} apps indexed")
+            try:
+                with open(self.index_path, 'w') as f: json.dump(apps, f)
+            except Exception as e: Logger.error(f"AppIndex: Failed to save index: {e}")
+            return True
+    def refresh_async(self, on_done=None):
+        with self._waiters_lock:
+            if on_done: self.waiters.append(on_done)
+            if self.refreshing: return
+            self.refreshing = True
+        def _refresh():
+            try: self.refresh()
+            except Exception as e: Logger.error(f"AppIndex: Refresh failed: {e}")
+            finally:
+                self.source.release_thread()
+                with self._waiters_lock: self.refreshing, waiters, self.waiters = False, self.waiters, []
+                for callback in waiters: Clock.schedule_once(lambda dt, callback=callback: callback())
+        Thread(target=_refresh, daemon=True).start()
+    def ranked(self, query=None):
+        (apps, trigrams), scores, query_grams = self.snapshot, {}, self.trigrams_of(query) if query else set()
+        for gram in query_grams:
+            for package in trigrams.get(gram, ()): scores[package] = scores.get(package, 0) + 1
+        def _score(package): return scores.get(package, 0) / (len(query_grams) + len(self.trigrams_of(apps[package])) - scores.get(package, 0)) if package in scores else 0.0
+        return [{"name": apps[package], "package": package} for package in sorted(apps, key=lambda package: (-_score(package), apps[package].lower()))]
 class CommandProcessor:
-    def __init__(self, nlu_processor, app_instance):
-        self.nlu_processor, self.app = nlu_processor, app_instance; self.active, self.stream, self._current_callback = False, None, None
+    def __init__(self, nlu_processor, app_instance, capture_engine, model_manager, speech_cache=None, tracer=None):
+        self.nlu_processor, self.app, self.capture, self.models, self.speech_cache, self.tracer = nlu_processor, app_instance, capture_engine, model_manager, speech_cache, tracer or TurnTracer(); self.active, self.subscription, self._current_callback = False, None, None
         self.current_lang_code, self.stt_recognizer, self.tts_voice = None, None, None
+        self.tts_player, self.last_tts_first_audio, self.intent_matcher = StreamingAudioPlayer(), None, LocalIntentMatcher()
+        self.tts_lang_code, self.recognition_pool, self.recognition_thread, self.speaking, self._tts_cancel, self._buffered_level = None, None, None, False, Event(), 0.0
         self.action_handlers = {"open_app": self.handle_open_app, "web_search": self.handle_web_search, "play_media": self.handle_play_media, "control_vpn": self.handle_control_vpn, "make_call": self.handle_make_call, "check_phone_status": self.handle_check_phone_status, "learn_app_intent": self.handle_learn_app_intent, "enable_accessibility": self.handle_enable_accessibility, "chat": self.handle_chat}
-    def _load_model(self, model_type, lang_code):
-        global VoskModelEN, VoskModelHI, PiperVoiceEN, PiperVoiceHI
-        if model_type == 'stt':
-            if lang_code == 'en' and VoskModelEN is None and os.path.exists(VOSK_MODEL_PATH_EN): globals()['VoskModelEN'] = Model(VOSK_MODEL_PATH_EN)
-            elif lang_code == 'hi' and VoskModelHI is None and os.path.exists(VOSK_MODEL_PATH_HI): globals()['VoskModelHI'] = Model(VOSK_MODEL_PATH_HI)
-        elif model_type == 'tts':
-            if lang_code == 'en' and PiperVoiceEN is None and os.path.exists(PIPER_VOICE_EN_ONNX): globals()['PiperVoiceEN'] = piper.PiperVoice.load(PIPER_VOICE_EN_ONNX, config_path=PIPER_VOICE_EN_JSON)
-            elif lang_code == 'hi' and PiperVoiceHI is None and os.path.exists(PIPER_VOICE_HI_ONNX): globals()['PiperVoiceHI'] = piper.PiperVoice.load(PIPER_VOICE_HI_ONNX, config_path=PIPER_VOICE_HI_JSON)
     def set_language(self, lang_code):
-        self.current_lang_code = lang_code; self._load_model('stt', lang_code); self._load_model('tts', lang_code)
-        stt_model, self.tts_voice = (VoskModelEN, PiperVoiceEN) if lang_code == 'en' else (VoskModelHI, PiperVoiceHI)
-        self.stt_recognizer = KaldiRecognizer(stt_model, SAMPLE_RATE) if stt_model else None
-    def start_listening(self, callback_on_result):
-        if not self.stt_recognizer or not sd: return
+        auto = self.app.config.getboolean('models', 'auto_language'); self.current_lang_code = self.tts_lang_code = lang_code; self.models.pinned = {'en', 'hi'} if auto else {lang_code}
+        self.tts_voice, self.stt_recognizer = self.models.get('tts', lang_code), self.models.get_recognizer(lang_code)
+        recognizers = {lang: self.models.get_recognizer(lang) for lang in ('en', 'hi')} if auto else {}
+        if recognizers and all(recognizers.values()):
+            self.recognition_pool = self.recognition_pool or ThreadPoolExecutor(max_workers=len(recognizers), thread_name_prefix='stt')
+            self.stt_recognizer = BilingualRecognizer(recognizers, self.recognition_pool, lang_code, max_parallel_ms=self.app.config.getint('models', 'auto_language_window_ms'), early_decision_ms=self.app.config.getint('models', 'auto_language_early_ms'))
+    def start_listening(self, callback_on_result, start_position=None):
+        if not self.stt_recognizer or (self.capture.live and not sd): return
         self.active, self._current_callback = True, callback_on_result
-        def audio_callback(indata, f, t, s):
-            if self.active and self.stt_recognizer.AcceptWaveform(bytes(indata)): result = self.stt_recognizer.Result(); Clock.schedule_once(lambda dt: self.stop_listening()); Clock.schedule_once(lambda dt: self.process_stt_result(result))
-        with audio_lock: self.stream = sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16', blocksize=int(SAMPLE_RATE * 0.2), callback=audio_callback); self.stream.start()
+        if isinstance(self.stt_recognizer, BilingualRecognizer): self.stt_recognizer.Reset()
+        preroll, block_size = int(SAMPLE_RATE * self.app.config.getint('audio', 'preroll_ms') / 1000), int(SAMPLE_RATE * 0.2); wake_position = self.capture.position if start_position is None else start_position
+        self.subscription = self.capture.subscribe(block_size, start_position, preroll); self.recognition_thread = Thread(target=self._recognize_loop, args=(self.subscription, wake_position, -(-preroll // block_size) + 1), daemon=True); self.recognition_thread.start()
+    def _finish_recognition(self, result): self.tracer.mark('stt_final'); Clock.schedule_once(lambda dt: self.stop_listening()); Clock.schedule_once(lambda dt: self.process_stt_result(result))
+    def _recognize_loop(self, subscription, wake_position=0, leading_blocks=1):
+        config = self.app.config; leading = deque(maxlen=leading_blocks)
+        vad = VoiceActivityEndpointer(config.getfloat('audio', 'vad_energy_threshold'), config.getint('audio', 'trailing_silence_ms'), config.getint('audio', 'max_utterance_ms'))
+        while self.active and not subscription.closed:
+            block = subscription.read()
+            if block is None or not self.active: continue
+            self.tracer.mark('first_command_frame')
+            if subscription.position - len(block) < wake_position: leading.append(block); continue
+            _, endpoint = vad.update(block)
+            if not vad.speech_started: leading.append(block)
+            else:
+                blocks = [*leading, block]; leading.clear()
+                if any([self.stt_recognizer.AcceptWaveform(b.tobytes()) for b in blocks]): self._finish_recognition(self.stt_recognizer.Result()); break
+            if endpoint: Logger.info(f"VAD: Endpoint after {vad.elapsed_ms:.0f} ms ({endpoint})"); self._finish_recognition(self.stt_recognizer.FinalResult()); break
     def stop_listening(self):
          if not self.active: return
          self.active = False
-         with audio_lock:
-             if self.stream: self.stream.stop(); self.stream.close(); self.stream = None
+         if self.subscription: self.subscription.close(); self.subscription = None
     def process_stt_result(self, vosk_result_json):
         if self.active: self.stop_listening()
         transcript = ""; nlu_json = {"transcript": transcript}
-        try: transcript = json.loads(vosk_result_json).get('text', ''); nlu_json["transcript"] = transcript
-        except Exception: pass
-        if transcript: self.nlu_processor.process_text(transcript, lambda res: self.handle_nlu_response({**res, **nlu_json}))
+        try: stt_result = json.loads(vosk_result_json); transcript = stt_result.get('text', ''); nlu_json["transcript"] = transcript
+        except Exception: stt_result = {}
+        if stt_result.get('lang') and stt_result['lang'] != self.tts_lang_code: self.tts_voice, self.tts_lang_code = self.models.get('tts', stt_result['lang']) or self.tts_voice, stt_result['lang']
+        local_match = self.intent_matcher.match(transcript) if transcript and self.app.config.getboolean('nlu_server', 'local_intents') else None
+        if local_match: action, params, spoken_response = local_match; self.tracer.mark('local_intent', served_locally=True); self.handle_nlu_response({"action": action, "parameters": params, "spoken_response": spoken_response, "served_locally": True, **nlu_json})
+        elif transcript: self.tracer.mark('nlu_sent', served_locally=False); self.nlu_processor.process_text(transcript, lambda res: (self.tracer.mark('nlu_received'), self.handle_nlu_response({**res, **nlu_json})))
         elif self._current_callback: Clock.schedule_once(lambda dt: self._current_callback(""))
     def handle_nlu_response(self, nlu_json):
         action, params, spoken_response = nlu_json.get("action", "chat"), nlu_json.get("parameters", {}), nlu_json.get("spoken_response", "I'm not sure.")
-        self.app.add_log(f"[b]You:[/b] {nlu_json.get('transcript', '')}"); self.app.add_log(f"[i]NLU -> {action}, Params: {params}[/i]")
+        self.app.add_log(f"[b]You:[/b] {nlu_json.get('transcript', '')}"); self.app.add_log(f"[i]{'Local' if nlu_json.get('served_locally') else 'NLU'} -> {action}, Params: {params}[/i]")
         self.action_handlers.get(action, self.handle_chat)(params, spoken_response)
     def handle_chat(self, params, spoken_response): self.run_tts(spoken_response)
     def handle_open_app(self, params, spoken_response):
@@ -227,30 +743,93 @@ class CommandProcessor:
         self.run_tts(spoken_response)
     def handle_learn_app_intent(self, params, spoken_response): self.run_tts(spoken_response, on_finish_callback=lambda: self.app.launch_app_picker(params.get("app_name", "the app")))
     def handle_enable_accessibility(self, params, spoken_response): self.run_tts(spoken_response, on_finish_callback=self.app.open_accessibility_settings)
+    def _tts_sample_rate(self, voice=None): return getattr(getattr(voice or self.tts_voice, 'config', None), 'sample_rate', SAMPLE_RATE)
+    @staticmethod
+    def _synthesize_chunks(voice, text):
+        for sentence in split_sentences(text):
+            for chunk in voice.synthesize(sentence): yield getattr(chunk, 'audio_int16_bytes', chunk)
+    def _voice_snapshot(self):
+        voice = self.tts_voice
+        return voice, next((os.path.basename(self.models.SOURCES[key][0]) for key, model in list(self.models.models.items()) if model is voice), None)
+    def warm_speech_cache(self, phrases=CANNED_RESPONSES):
+        for text in phrases:
+            voice, voice_id = self._voice_snapshot()
+            try:
+                if voice and voice_id and self.speech_cache and not self.speech_cache.contains(voice_id, text): self.speech_cache.put(voice_id, text, b"".join(self._synthesize_chunks(voice, text)))
+            except Exception as e: Logger.error(f"SpeechCache: Warm-up failed for '{text}': {e}")
+    def interrupt_tts(self):
+        self._tts_cancel.set(); self.tts_player.interrupt()
+        if sd: sd.stop()
+    def is_barge_in(self, audio_position=None):
+        mic = self.capture.recent(self.capture.max_block, audio_position); playback = self._buffered_level if self._buffered_level else self.tts_player.recent_level()
+        mic_level = float(np.sqrt(np.mean(mic.astype(np.float32) ** 2))) if len(mic) else 0.0
+        return mic_level >= self.app.config.getfloat('audio', 'barge_in_echo_ratio') * playback
     def run_tts(self, spoken_response, on_finish_callback=None):
         final_callback = on_finish_callback if on_finish_callback else self._current_callback
+        cancel = self._tts_cancel = Event(); trace_id = self.tracer.current['trace_id'] if self.tracer.current else None
+        def _mark(stage, **fields):
+            if trace_id: self.tracer.mark(stage, trace_id, **fields)
         def _synthesize_and_play():
+            self.speaking = True
             try:
-                audio_data = b"".join(list(self.tts_voice.synthesize(spoken_response)))
-                if audio_data and sd:
-                     with audio_lock: sd.play(np.frombuffer(audio_data, dtype=np.int16), SAMPLE_RATE); sd.wait()
+                (voice, voice_id), synthesized, start = self._voice_snapshot(), [], time.monotonic()
+                cached = self.speech_cache.get(voice_id, spoken_response) if self.speech_cache and voice_id else None
+                def _collect(chunks, store):
+                    for chunk in chunks:
+                        if cancel.is_set(): return
+                        _mark('tts_first_chunk')
+                        if store: synthesized.append(chunk)
+                        yield chunk
+                if cached is not None: Logger.info(f"TTS: Cache hit for '{spoken_response[:40]}'"); chunks = _collect((cached[i:i + SAMPLE_RATE // 2] for i in range(0, len(cached), SAMPLE_RATE // 2)), False)
+                else: chunks = _collect(self._synthesize_chunks(voice, spoken_response), True)
+                if self.tts_player.available and self.app.config.getboolean('audio', 'tts_streaming'):
+                    first_audio = self.last_tts_first_audio = self.tts_player.play(chunks, self._tts_sample_rate(voice), start)
+                    if first_audio is not None: Logger.info(f"TTS: First audio after {first_audio * 1000:.0f} ms"); Clock.schedule_once(lambda dt: self.app.add_log(f"[i]TTS first audio: {first_audio * 1000:.0f} ms[/i]"))
+                else:
+                    if cached is not None: _mark('tts_first_chunk')
+                    audio_data = cached if cached is not None else np.frombuffer(b"".join(chunks), dtype=np.int16)
+                    if len(audio_data) and sd and not cancel.is_set():
+                         self.last_tts_first_audio, self._buffered_level = time.monotonic() - start, float(np.sqrt(np.mean(audio_data.astype(np.float32) ** 2)))
+                         with audio_lock: sd.play(audio_data, self._tts_sample_rate(voice)); sd.wait()
+                if cached is None and synthesized and self.speech_cache and voice_id and not cancel.is_set(): self.speech_cache.put(voice_id, spoken_response, b"".join(synthesized))
             except Exception as e: Logger.error(f"TTS failed: {e}")
             finally:
-                 if final_callback: Clock.schedule_once(lambda dt: final_callback(spoken_response if on_finish_callback is None else None))
+                 self.speaking, self._buffered_level = False, 0.0; _mark('playback_end', interrupted=cancel.is_set())
+                 if final_callback and not cancel.is_set(): Clock.schedule_once(lambda dt: final_callback(spoken_response if on_finish_callback is None else None))
         Thread(target=_synthesize_and_play, daemon=True).start()
 class VoiceAssistantApp(App):
     use_kivy_settings, REQUIRED_PERMISSIONS = True, ["android.permission.RECORD_AUDIO", "android.permission.INTERNET", "android.permission.READ_PHONE_STATE", "android.permission.CALL_PHONE"]
     def get_current_nlu_url(self):
         try: return self.config.get('nlu_server', f"{self.config.get('nlu_server', 'active_backend').lower()}_url")
         except Exception: return None
-    def build_config(self, config): config.setdefaults('nlu_server', {'active_backend': 'Local', 'local_url': 'http://192.168.1.100:5000', 'ec2_url': 'http://YOUR_EC2_PUBLIC_IP:5000', 'lightning_url': 'https://YOUR_LIGHTNING_URL.litng.ai'})
+    def get_nlu_backends(self):
+        if self.config.get('nlu_server', 'active_backend') != 'Auto': return None
+        return [url for url in (self.config.get('nlu_server', f"{name}_url") for name in ('local', 'ec2', 'lightning')) if url and url.startswith('http')]
+    def build_config(self, config):
+        config.setdefaults('nlu_server', {'active_backend': 'Local', 'local_url': 'http://192.168.1.100:5000', 'ec2_url': 'http://YOUR_EC2_PUBLIC_IP:5000', 'lightning_url': 'https://YOUR_LIGHTNING_URL.litng.ai', 'connect_timeout': 5, 'read_timeout': 60, 'probe_interval': 30, 'local_intents': 1})
+        config.setdefaults('audio', {'tts_streaming': 1, 'preroll_ms': 300, 'vad_energy_threshold': 500, 'trailing_silence_ms': 700, 'max_utterance_ms': 8000, 'tts_cache_mb': 50, 'tts_cache_warmup': 1, 'barge_in': 1, 'barge_in_echo_ratio': 0.5})
+        config.setdefaults('models', {'preload_languages': 'en,hi', 'memory_budget_mb': 512, 'auto_language': 0, 'auto_language_window_ms': 3000, 'auto_language_early_ms': 1000, 'staged_startup': 1})
+        config.setdefaults('diagnostics', {'trace_turns': 0, 'trace_max_kb': 512})
     def build_settings(self, settings): settings.add_json_panel('NLU Server', self.config, 'settings.json')
     def on_config_change(self, config, section, key, value):
-        if section == 'nlu_server': self.add_log(f"[i]Active NLU Server URL is now: {self.get_current_nlu_url()}[/i]")
+        if section == 'nlu_server' and key in ('connect_timeout', 'read_timeout'): self.nlu_processor.timeout = (config.getfloat('nlu_server', 'connect_timeout'), config.getfloat('nlu_server', 'read_timeout'))
+        elif section == 'nlu_server' and key == 'probe_interval': self.nlu_processor.probe_interval = config.getfloat('nlu_server', 'probe_interval')
+        elif section == 'nlu_server' and self.get_nlu_backends(): self.add_log(f"[i]Routing NLU requests across: {', '.join(self.get_nlu_backends())}[/i]"); Thread(target=self.nlu_processor.probe_backends, daemon=True).start()
+        elif section == 'audio' and key == 'tts_cache_mb': self.speech_cache.max_bytes = config.getint('audio', 'tts_cache_mb') * 1024 * 1024
+        elif section == 'diagnostics': self.tracer.enabled, self.tracer.max_bytes = config.getboolean('diagnostics', 'trace_turns'), config.getint('diagnostics', 'trace_max_kb') * 1024
+        elif section == 'models' and key in ('auto_language', 'auto_language_window_ms', 'auto_language_early_ms') and self.state == "IDLE":
+            self.update_status("LOADING_MODELS"); self.lang_button.disabled = True; self.model_manager.pinned = {'en', 'hi'} if config.getboolean('models', 'auto_language') else {self.current_lang}
+            self.model_manager.preload(list(self.model_manager.pinned), self.show_load_progress, self.on_language_loaded)
+        elif section == 'models' and key == 'memory_budget_mb': self.model_manager.budget = config.getint('models', 'memory_budget_mb') * 1024 * 1024
+        elif section == 'nlu_server': self.add_log(f"[i]Active NLU Server URL is now: {self.get_current_nlu_url()}[/i]")
     def build(self):
-        self.settings_cls = SettingsWithSidebar; self.state, self.current_lang, self.wake_word_listener = "INITIALIZING", "en", None
-        self.nlu_processor = NetworkNLUProcessor(self.get_current_nlu_url); self.command_processor = CommandProcessor(self.nlu_processor, self)
+        self.settings_cls = SettingsWithSidebar; self.state, self.current_lang, self.wake_word_listener, self.pending_wake_words = "INITIALIZING", "en", None, deque(maxlen=4)
+        self.nlu_processor = NetworkNLUProcessor(self.get_current_nlu_url, self.config.getfloat('nlu_server', 'connect_timeout'), self.config.getfloat('nlu_server', 'read_timeout'), get_backends_callback=self.get_nlu_backends, probe_interval=self.config.getfloat('nlu_server', 'probe_interval')); self.nlu_processor.start_probing(); self.capture_engine = AudioCaptureEngine()
+        self.model_manager = ModelManager(self.config.getint('models', 'memory_budget_mb')); self.speech_cache = SpeechCache(os.path.join(self.user_data_dir, 'tts_cache'), self.config.getint('audio', 'tts_cache_mb'))
+        self.tracer = TurnTracer(os.path.join(self.user_data_dir, 'turn_traces.jsonl'), self.config.getboolean('diagnostics', 'trace_turns'), self.config.getint('diagnostics', 'trace_max_kb') * 1024)
+        self.command_processor = CommandProcessor(self.nlu_processor, self, self.capture_engine, self.model_manager, self.speech_cache, self.tracer)
         self.CUSTOM_ACTIONS_FILE = os.path.join(self.user_data_dir, 'custom_actions.json'); self.custom_actions = self.load_custom_actions()
+        self.app_index = AppIndex(os.path.join(self.user_data_dir, 'app_index.json'), AndroidAppSource() if platform == 'android' and autoclass else StaticAppSource()); self.command_processor.intent_matcher.rebuild(self.custom_actions, lambda package: self.app_index.apps.get(package))
         self.root_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
         self.permission_label = Label(text="Permissions pending...", color=(1, 0.6, 0, 1), size_hint_y=None, height=40)
         self.status_label = Label(text="Status: INITIALIZING", size_hint_y=None, height=40)
@@ -259,10 +838,12 @@ class VoiceAssistantApp(App):
         button_layout = BoxLayout(size_hint_y=None, height=50, spacing=10)
         self.start_button = Button(text="Start Listener", on_press=self.toggle_ww_listener); self.lang_button = Button(text="Switch to Hindi", on_press=self.toggle_language)
         self.reset_button = Button(text="Reset Chat", on_press=self.reset_chat); self.settings_button = Button(text="Settings", on_press=self.open_settings)
-        for btn in [self.start_button, self.lang_button, self.reset_button, self.settings_button]: button_layout.add_widget(btn)
+        self.stats_button = Button(text="Latency", on_press=self.show_latency_stats)
+        for btn in [self.start_button, self.lang_button, self.reset_button, self.settings_button, self.stats_button]: button_layout.add_widget(btn)
         for widget in [self.permission_label, self.status_label, self.log_view, button_layout]: self.root_layout.add_widget(widget)
-        return self.root_layout
+        STARTUP_PROFILE.stage('build'); return self.root_layout
     def on_start(self):
+        Clock.schedule_once(lambda dt: STARTUP_PROFILE.stage('first_frame')); self.app_index.refresh_async()
         if platform == 'android' and Permission: self.request_all_permissions()
         else: self.permissions_granted = True; self.on_permissions_granted()
     def request_all_permissions(self):
@@ -277,32 +858,75 @@ class VoiceAssistantApp(App):
     def on_permissions_granted(self):
         self.permissions_granted = True; self.permission_label.text = "All essential permissions granted."; self.permission_label.color = (0, 1, 0.3, 1); self.initialize_components()
     def initialize_components(self):
-        self.command_processor.set_language(self.current_lang)
-        if sd and self.command_processor.stt_recognizer and self.command_processor.tts_voice: self.update_status("IDLE"); self.add_log("[color=00ff00]Components Initialized.[/color]")
-        else: self.update_status("ERROR: Components Failed"); self.add_log("[color=ff0000]Error: A core component failed to load.[/color]")
+        STARTUP_PROFILE.stage('permissions'); auto = self.config.getboolean('models', 'auto_language')
+        required, preload = [self.current_lang] + (['en', 'hi'] if auto else []), [lang.strip() for lang in self.config.get('models', 'preload_languages').split(',') if lang.strip() in ('en', 'hi')]
+        self.model_manager.pinned = {'en', 'hi'} if auto else {self.current_lang}
+        if self.config.getboolean('models', 'staged_startup'): self.start_ww_listener()
+        self.update_status("LOADING_MODELS")
+        def _on_required_loaded():
+            self.on_models_loaded()
+            if preload: self.model_manager.preload(preload, done_callback=lambda: STARTUP_PROFILE.stage('preload_done'))
+        self.model_manager.preload(required, self.show_load_progress, _on_required_loaded)
+    def show_load_progress(self, message): self.status_label.text = f"Status: {self.state} ({message})"
+    def warm_speech_cache(self):
+        if self.config.getboolean('audio', 'tts_cache_warmup'): Thread(target=self.command_processor.warm_speech_cache, daemon=True).start()
+    def on_models_loaded(self):
+        self.command_processor.set_language(self.current_lang); self.warm_speech_cache()
+        if sd and self.command_processor.stt_recognizer and self.command_processor.tts_voice:
+            self.update_status("LISTENING_WW" if self.wake_word_listener else "IDLE"); self.add_log("[color=00ff00]Components Initialized.[/color]"); STARTUP_PROFILE.stage('ready'); self.dump_startup_profile()
+            if self.pending_wake_words: self.replay_pending_wake_word()
+        else: self.update_status("ERROR: Components Failed"); self.add_log("[color=ff0000]Error: A core component failed to load.[/color]"); self.pending_wake_words.clear(); STARTUP_PROFILE.stage('failed'); self.dump_startup_profile()
+    def replay_pending_wake_word(self):
+        audio_position, detected_at = self.pending_wake_words.pop(); self.pending_wake_words.clear()
+        if audio_position is not None and self.capture_engine.position - audio_position > self.capture_engine.capacity - self.capture_engine.max_block: self.add_log("[i]The queued wake word is too old to replay, please say it again.[/i]"); return
+        self.on_wake_word_detected(audio_position, detected_at)
+    def dump_startup_profile(self):
+        profile = STARTUP_PROFILE.as_dict()
+        try:
+            with open(os.path.join(self.user_data_dir, 'startup_profile.json'), 'w') as f: json.dump(profile, f, indent=2)
+        except Exception as e: Logger.error(f"Failed to save startup profile: {e}")
+        if PROFILE_STARTUP: print(json.dumps(profile, indent=2)); self.stop()
     def toggle_ww_listener(self, instance):
         if self.wake_word_listener and self.wake_word_listener.is_alive(): self.stop_ww_listener()
         else: self.start_ww_listener()
     def start_ww_listener(self):
-        self.wake_word_listener = WakeWordListener(PICOVOICE_ACCESS_KEY, PORCUPINE_KEYWORD_PATHS, PORCUPINE_MODEL_PATH, self.on_wake_word_detected)
+        self.wake_word_listener = WakeWordListener(PICOVOICE_ACCESS_KEY, PORCUPINE_KEYWORD_PATHS, PORCUPINE_MODEL_PATH, self.on_wake_word_detected, self.capture_engine)
         if self.wake_word_listener and self.wake_word_listener.porcupine:
-            self.wake_word_listener.start(); self.update_status("LISTENING_WW"); self.start_button.text = "Stop Listener"
+            self.wake_word_listener.start(); self.update_status("LISTENING_WW"); self.start_button.text = "Stop Listener"; STARTUP_PROFILE.stage('wake_word_ready')
             self.lang_button.disabled = self.reset_button.disabled = self.settings_button.disabled = True
     def stop_ww_listener(self):
         if self.wake_word_listener: self.wake_word_listener.stop()
-        self.wake_word_listener = None; self.start_button.text = "Start Listener"
+        self.wake_word_listener = None; self.start_button.text = "Start Listener"; self.pending_wake_words.clear(); self.nlu_processor.cancel_pending(); self.command_processor.stop_listening()
         self.lang_button.disabled = self.reset_button.disabled = self.settings_button.disabled = False
-        if self.state in ["LISTENING_WW", "STARTING_WW"]: self.update_status("IDLE")
-    def on_wake_word_detected(self):
-        if self.state == "LISTENING_WW": self.add_log("[color=00ffff]Wake Word Detected![/color]"); self.update_status("LISTENING_CMD"); self.command_processor.start_listening(self.on_command_result)
+        if self.state in ["LISTENING_WW", "STARTING_WW", "LISTENING_CMD"]: self.update_status("IDLE")
+    def on_wake_word_detected(self, audio_position=None, detected_at=None):
+        if not self.command_processor.stt_recognizer:
+            if self.state == "LOADING_MODELS" or self.state == "LISTENING_WW": self.pending_wake_words.append((audio_position, detected_at)); self.add_log("[color=00ffff]Wake Word Detected![/color] [i]Waiting for speech recognition to load...[/i]")
+            return
+        if self.state == "LISTENING_CMD" and self.command_processor.speaking and self.config.getboolean('audio', 'barge_in'):
+            if not self.command_processor.is_barge_in(audio_position): Logger.info("BargeIn: Ignored wake word below the playback echo level"); return
+            self.tracer.mark('playback_end', interrupted=True); self.command_processor.interrupt_tts(); self.add_log("[color=00ffff]Interrupted reply.[/color]"); self.add_log("-" * 20); self.update_status("LISTENING_WW")
+        if self.state == "LISTENING_WW": self.tracer.begin(detected_at); self.add_log("[color=00ffff]Wake Word Detected![/color]"); self.update_status("LISTENING_CMD"); self.command_processor.start_listening(self.on_command_result, audio_position)
     def on_command_result(self, final_spoken_response):
+        self.tracer.mark('ui_callback'); self.tracer.finish()
         if final_spoken_response: self.add_log(f"[b]Bot:[/b] {final_spoken_response}")
         self.add_log("-" * 20)
         if self.start_button.text == "Stop Listener": self.update_status("LISTENING_WW")
         else: self.update_status("IDLE")
     def toggle_language(self, instance):
         self.current_lang = "hi" if self.current_lang == "en" else "en"; self.lang_button.text = f"Switch to {'English' if self.current_lang == 'hi' else 'Hindi'}"
-        self.add_log(f"[i]Switching language to {self.current_lang}...[/i]"); self.command_processor.set_language(self.current_lang)
+        self.add_log(f"[i]Switching language to {self.current_lang}...[/i]")
+        if self.model_manager.is_resident(self.current_lang): self.command_processor.set_language(self.current_lang); self.warm_speech_cache(); return
+        self.update_status("LOADING_MODELS"); self.lang_button.disabled = True; self.model_manager.pinned = {self.current_lang}
+        self.model_manager.preload([self.current_lang], self.show_load_progress, self.on_language_loaded)
+    def on_language_loaded(self):
+        self.command_processor.set_language(self.current_lang); self.warm_speech_cache(); self.lang_button.disabled = bool(self.wake_word_listener); self.update_status("LISTENING_WW" if self.wake_word_listener else "IDLE")
+    def show_latency_stats(self, instance):
+        stats = self.tracer.stage_percentiles()
+        self.add_log("[b]Startup (ms since launch):[/b] " + ", ".join(f"{stage} {ms:.0f}" for stage, ms in STARTUP_PROFILE.as_dict()['stages_ms'].items()))
+        if not stats: self.add_log("[i]No turn traces recorded. Enable 'Trace Turns' in Settings.[/i]"); return
+        self.add_log("[b]Turn latency per stage (p50 / p95):[/b]")
+        for stage, stat in stats.items(): self.add_log(f"  {stage}: {stat['p50']:.0f} / {stat['p95']:.0f} ms (n={stat['count']})")
     def reset_chat(self, instance): self.add_log("[i]Resetting chat history on server...[/i]"); self.nlu_processor.reset_history()
     def update_status(self, new_state): self.state = new_state; self.status_label.text = f"Status: {self.state}"
     def add_log(self, message):
@@ -319,24 +943,15 @@ class VoiceAssistantApp(App):
         try:
             with open(self.CUSTOM_ACTIONS_FILE, 'w') as f: json.dump(self.custom_actions, f, indent=4)
         except Exception as e: Logger.error(f"Failed to save custom actions: {e}")
-    def get_installed_apps(self):
-        app_list = []
-        if platform == 'android' and autoclass:
-            try:
-                PythonActivity = autoclass('org.kivy.android.PythonActivity'); Intent = autoclass('android.content.Intent'); intent = Intent(Intent.ACTION_MAIN, None); intent.addCategory(Intent.CATEGORY_LAUNCHER)
-                apps = PythonActivity.mActivity.getPackageManager().queryIntentActivities(intent, 0)
-                for app_info in apps: app_list.append({"name": app_info.loadLabel(PythonActivity.mActivity.getPackageManager()).toString(), "package": app_info.activityInfo.packageName})
-                app_list.sort(key=lambda x: x['name'].lower())
-            except Exception as e: Logger.error(f"Failed to get installed apps: {e}")
-        return app_list
+    def get_installed_apps(self, app_name_guess=None): return self.app_index.ranked(app_name_guess)
     def launch_app_picker(self, app_name_guess):
-        installed_apps = self.get_installed_apps()
-        if not installed_apps: return
+        if not self.app_index.apps: self.app_index.refresh_async(on_done=lambda: self.app_index.apps and self.launch_app_picker(app_name_guess)); return
+        installed_apps = self.get_installed_apps(app_name_guess); self.app_index.refresh_async()
         def on_app_selected(selected_app):
             app_name, package_name = selected_app['name'], selected_app['package']
             self.add_log(f"[color=00ff00]Learned: '{app_name}' is '{package_name}'[/color]")
             self.custom_actions[app_name.lower()] = self.custom_actions[app_name_guess.lower()] = package_name
-            self.save_custom_actions()
+            self.save_custom_actions(); self.command_processor.intent_matcher.rebuild(self.custom_actions)
             learning_text = f"Learning complete: The app '{app_name}' has package name '{package_name}'. Remember this."
             self.nlu_processor.process_text(learning_text, lambda res: self.add_log(f"[i]NLU confirmation: {res.get('spoken_response')}[/i]"))
         app_picker = AppListView(app_list=installed_apps, callback=on_app_selected); app_picker.open()
@@ -347,8 +962,9 @@ class VoiceAssistantApp(App):
                 intent = Intent(Settings.ACTION_ACCESSIBILITY_SETTINGS); PythonActivity.mActivity.startActivity(intent)
                 self.add_log("Please find this app in the list and enable its service.")
             except Exception as e: self.add_log(f"[color=ff0000]Could not open accessibility settings: {e}[/color]")
-    def on_stop(self): self.stop_ww_listener(); self.command_processor.stop_listening()
+    def on_stop(self): self.stop_ww_listener(); self.command_processor.stop_listening(); self.command_processor.tts_player.close(); self.nlu_processor.close()
 
 if __name__ == '__main__':
     if not PICOVOICE_ACCESS_KEY: print("FATAL ERROR: PICOVOICE_ACCESS_KEY not found in .env file."); exit()
     VoiceAssistantApp().run()
+    if PROFILE_STARTUP and 'failed' in STARTUP_PROFILE.stages: sys.exit(1)
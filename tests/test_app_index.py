@@ -0,0 +1,35 @@
+import os
+import sys
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AppIndex, StaticAppSource
+
+
+class CountingAppSource(StaticAppSource):
+    def __init__(self, apps=None): super().__init__(apps); self.labels_loaded = []
+    def load_label(self, handle): self.labels_loaded.append(handle); return super().load_label(handle)
+
+
+def test_refresh_only_loads_labels_of_new_packages(tmp_path):
+    index_path = str(tmp_path / 'app_index.json')
+    source = CountingAppSource({'com.whatsapp': 'WhatsApp', 'com.spotify.music': 'Spotify', 'org.videolan.vlc': 'VLC'})
+    assert AppIndex(index_path, source).refresh()
+    assert sorted(source.labels_loaded) == ['com.spotify.music', 'com.whatsapp', 'org.videolan.vlc']
+
+    source.apps.pop('org.videolan.vlc'); source.apps['com.google.android.youtube'] = 'YouTube'; source.labels_loaded.clear()
+    index = AppIndex(index_path, source)
+    assert index.apps == {'com.whatsapp': 'WhatsApp', 'com.spotify.music': 'Spotify', 'org.videolan.vlc': 'VLC'}
+    assert index.refresh()
+    assert source.labels_loaded == ['com.google.android.youtube']
+    assert index.apps == {'com.whatsapp': 'WhatsApp', 'com.spotify.music': 'Spotify', 'com.google.android.youtube': 'YouTube'}
+    assert not index.refresh()
+    assert AppIndex(index_path, source).apps == index.apps
+
+
+def test_ranked_puts_closest_label_first(tmp_path):
+    index = AppIndex(str(tmp_path / 'app_index.json'), StaticAppSource({'com.whatsapp': 'WhatsApp', 'com.spotify.music': 'Spotify', 'com.google.android.youtube': 'YouTube', 'com.android.chrome': 'Chrome'}))
+    index.refresh()
+    assert index.ranked('whats app')[0]['package'] == 'com.whatsapp'
+    assert index.ranked('you tube')[0]['package'] == 'com.google.android.youtube'
+    assert [app['name'] for app in index.ranked()] == ['Chrome', 'Spotify', 'WhatsApp', 'YouTube']